@@ -14,7 +14,7 @@ from common import storage
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         description=(
-            "Standalone consumer stub for Milestone 3. Reads messages from the local outbox "
+            "Standalone consumer stub for Milestone 3. Reads messages from the local outbox table "
             "and saves them to SQLite with duplicate detection before insert."
         )
     )
@@ -29,6 +29,12 @@ def parse_args() -> argparse.Namespace:
         default=0,
         help="Max number of messages to process this run (0 = all pending)",
     )
+    parser.add_argument(
+        "--commit-every",
+        type=int,
+        default=500,
+        help="Number of messages saved per SQLite transaction before the offset is persisted",
+    )
     parser.add_argument(
         "--reset-offset",
         action="store_true",
@@ -44,18 +50,18 @@ def parse_args() -> argparse.Namespace:
 
 def main() -> int:
     args = parse_args()
+    args.commit_every = max(1, args.commit_every)
     storage.init_db()
 
     if args.reset_offset:
         storage.set_consumer_offset(args.consumer_name, 0)
-        print(f"Reset offset for consumer '{args.consumer_name}' to line 0.")
+        print(f"Reset offset for consumer '{args.consumer_name}' to outbox id 0.")
 
     current_offset = storage.get_consumer_offset(args.consumer_name)
     summary = storage.get_summary()
-    print(f"Outbox: {summary['outbox_path']}")
-    print(f"Database: {summary['db_path']}")
-    print(f"Current offset ({args.consumer_name}): line {current_offset}")
-    print(f"Outbox queued messages (all-time lines): {summary['outbox_count']}")
+    print(f"Database (messages + outbox): {summary['db_path']}")
+    print(f"Current offset ({args.consumer_name}): outbox id {current_offset}")
+    print(f"Outbox queued messages (all-time): {summary['outbox_count']}")
     print(f"DB rows before run: {summary['db_total']} (duplicates: {summary['db_duplicates']})")
 
     if args.status_only:
@@ -64,31 +70,52 @@ def main() -> int:
     processed = 0
     duplicates = 0
     latest_offset = current_offset
+    pending: list[tuple[int, dict]] = []
+
+    def flush_pending() -> None:
+        nonlocal processed, duplicates, latest_offset
+        if not pending:
+            return
+
+        # Take the batch first so a failed insert is never retried by the caller's finally.
+        batch = pending[:]
+        pending.clear()
+        # The offset commits with the rows, so a crash never replays them as duplicates.
+        results = storage.insert_messages_batch(
+            (envelope for _, envelope in batch),
+            consumer_name=args.consumer_name,
+            offset=batch[-1][0],
+        )
+        latest_offset = batch[-1][0]
 
-    try:
-        for line_number, envelope in storage.iter_outbox_from_line(current_offset):
-            if args.batch_size and processed >= args.batch_size:
-                break
-
-            payload = envelope.get("payload") or {}
-            result = storage.insert_message_from_payload(
-                payload,
-                transport_id=envelope.get("transport_id"),
-                source=envelope.get("source"),
-                consumer_name=args.consumer_name,
-            )
-            latest_offset = line_number
-            storage.set_consumer_offset(args.consumer_name, latest_offset)
-
+        for (outbox_id, _), result in zip(batch, results):
             processed += 1
             if result["is_duplicate"]:
                 duplicates += 1
 
             status = "DUPLICATE" if result["is_duplicate"] else "NEW"
             print(
-                f"Processed line {line_number}: [{status}] "
+                f"Processed outbox id {outbox_id}: [{status}] "
                 f"message_id={result['message_id']} db_id={result['id']}"
             )
+
+    try:
+        try:
+            for outbox_id, envelope in storage.iter_outbox_from_id(current_offset):
+                if args.batch_size and processed + len(pending) >= args.batch_size:
+                    break
+
+                try:
+                    storage.validate_outbox_envelope(envelope)
+                except ValueError as exc:
+                    raise ValueError(f"Invalid payload in outbox at id {outbox_id}: {exc}") from exc
+
+                pending.append((outbox_id, envelope))
+                if len(pending) >= args.commit_every:
+                    flush_pending()
+        finally:
+            # Messages read before an invalid one are still committed.
+            flush_pending()
     except ValueError as exc:
         print(f"Consumer stopped due to invalid outbox message: {exc}", file=sys.stderr)
         return 1
@@ -98,7 +125,7 @@ def main() -> int:
     else:
         print(
             f"Processed {processed} message(s). Duplicate rows flagged this run: {duplicates}. "
-            f"New offset: line {latest_offset}."
+            f"New offset: outbox id {latest_offset}."
         )
 
     summary_after = storage.get_summary()
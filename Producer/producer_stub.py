@@ -16,7 +16,7 @@ def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         description=(
             "Standalone producer stub for Milestone 3. "
-            "Creates a message payload and writes it to a local outbox file (no Pub/Sub yet)."
+            "Creates a message payload and writes it to a local outbox table (no Pub/Sub yet)."
         )
     )
     parser.add_argument("content", nargs="?", help="Message content to publish to the local outbox")
@@ -67,7 +67,7 @@ def main() -> int:
 
     print("Producer stub queued a message (local outbox only; no Pub/Sub yet).")
     print(json.dumps({"envelope": envelope, "payload": payload}, indent=2))
-    print(f"Outbox file: {summary['outbox_path']}")
+    print(f"Outbox database: {summary['db_path']}")
     print(f"Outbox messages waiting: {summary['outbox_count']}")
     return 0
 
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from common import storage
+
+
+class FetchPlanTests(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        data_dir = Path(tmp.name)
+        for name, value in (
+            ("DATA_DIR", data_dir),
+            ("DB_PATH", data_dir / "messages.db"),
+            ("LEGACY_OUTBOX_PATH", data_dir / "local_outbox.jsonl"),
+            ("LEGACY_CONSUMER_STATE_PATH", data_dir / "consumer_state.json"),
+            ("_tls", threading.local()),
+            ("_db_initialized", False),
+        ):
+            patcher = mock.patch.object(storage, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.conn = storage._conn()
+        self.addCleanup(self.conn.close)
+
+    def test_fts_search_with_duplicate_filter_is_driven_by_fts(self) -> None:
+        if not storage._fts_enabled:
+            self.skipTest("SQLite has no FTS5 trigram tokenizer")
+
+        for (sort_key, duplicate_filter, search_mode), sql in storage._FETCH_SQL.items():
+            if search_mode != "fts" or duplicate_filter == "all":
+                continue
+            with self.subTest(sort_key=sort_key, duplicate_filter=duplicate_filter):
+                plan = [row[3] for row in self.conn.execute("EXPLAIN QUERY PLAN " + sql, ['"abc"'])]
+                self.assertIn("SEARCH messages USING INTEGER PRIMARY KEY (rowid=?)", plan)
+                self.assertFalse(any("idx_messages_dup_recv" in detail for detail in plan), plan)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,14 +1,16 @@
 """Flask demo shell for the capstone cloud messaging project.
 
 This version is intentionally local-only for Milestone 3:
-- Sender UI writes payloads to a local outbox file (simulating a producer)
-- Consumer is a separate script that reads the outbox and writes to SQLite
+- Sender UI saves payloads straight to the messages table (DIRECT_INSERT), or writes
+  them to a local outbox table (simulating a producer) when DIRECT_INSERT is False
+- Consumer is a separate script that reads the outbox and writes to the messages table
 - Viewer UI reads from SQLite and supports sorting/filtering/highlighting duplicates
 """
 
 from __future__ import annotations
 
 import sys
+from functools import lru_cache
 from pathlib import Path
 
 from flask import Flask, flash, redirect, render_template, request, session, url_for
@@ -21,14 +23,22 @@ from common import storage
 
 app = Flask(__name__)
 app.secret_key = "milestone-3-demo-secret"
+# False routes sender messages through the outbox and the consumer stub.
+app.config["DIRECT_INSERT"] = True
 storage.init_db()
 
 
+@lru_cache(maxsize=128)
+def _sender_payload_factory(user_name: str):
+    return storage.make_payload_factory(producer_name="web-sender-ui", user_name=user_name)
+
+
 @app.context_processor
 def inject_globals():
     return {
         "nav_summary": storage.get_summary(),
         "sort_options": storage.SORT_OPTIONS,
+        "direct_insert": app.config.get("DIRECT_INSERT", True),
     }
 
 
@@ -65,22 +75,28 @@ def sender():
         user_name = session.get("display_name") or "Guest"
 
         try:
-            payload = storage.create_payload(
-                content=content,
-                message_id=forced_message_id,
-                producer_name="web-sender-ui",
-                user_name=user_name,
+            payload = _sender_payload_factory(user_name)(content, message_id=forced_message_id)
+            envelope, result = storage.submit_message(
+                payload,
+                source="web-sender",
+                direct=app.config.get("DIRECT_INSERT", True),
             )
-            envelope = storage.append_outbox_message(payload, source="web-sender")
         except ValueError as exc:
             flash(str(exc), "error")
         else:
             last_payload = payload
             last_envelope = envelope
-            flash(
-                "Message added to the local outbox. Run the consumer stub to move it into the database.",
-                "success",
-            )
+            if result is None:
+                flash(
+                    "Message added to the local outbox. Run the consumer stub to move it into the database.",
+                    "success",
+                )
+            else:
+                status = "a duplicate" if result["is_duplicate"] else "new"
+                flash(
+                    f"Message saved to the database as row {result['id']} ({status}).",
+                    "success",
+                )
 
     return render_template(
         "sender.html",
@@ -121,4 +137,11 @@ def about():
 
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    try:
+        from waitress import serve
+    except ImportError:
+        # Werkzeug's development server; install waitress for concurrent requests.
+        app.run(debug=True, threaded=True)
+    else:
+        # Each waitress thread keeps its own SQLite connection (see storage._conn).
+        serve(app, host="127.0.0.1", port=5000, threads=8)
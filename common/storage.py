@@ -1,17 +1,28 @@
 from __future__ import annotations
 
+import bisect
 import json
 import sqlite3
+import threading
+import time
 import uuid
-from datetime import datetime, timezone
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, Dict, Iterator, Tuple
+from typing import Any, Callable, Dict, Iterable, Iterator, Tuple
+
+try:  # Optional: orjson parses outbox envelopes several times faster than json.
+    import orjson
+
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 DATA_DIR = PROJECT_ROOT / "data"
 DB_PATH = DATA_DIR / "messages.db"
-OUTBOX_PATH = DATA_DIR / "local_outbox.jsonl"
-CONSUMER_STATE_PATH = DATA_DIR / "consumer_state.json"
+# Files used by the outbox before it moved into SQLite; imported once by init_db.
+LEGACY_OUTBOX_PATH = DATA_DIR / "local_outbox.jsonl"
+LEGACY_CONSUMER_STATE_PATH = DATA_DIR / "consumer_state.json"
 
 SORT_OPTIONS = {
     "received_desc": ("Newest Received", "received_at DESC, id DESC"),
@@ -23,273 +34,731 @@ SORT_OPTIONS = {
 
 
 def utc_now_iso() -> str:
-    now = datetime.now(timezone.utc).replace(microsecond=0)
-    return now.isoformat().replace("+00:00", "Z")
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
 
 
 def ensure_data_dir() -> None:
     DATA_DIR.mkdir(parents=True, exist_ok=True)
 
 
-def init_db() -> None:
+_CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+)
+
+_db_initialized = False
+# Set by init_db: whether this database has the messages_fts search index.
+_fts_enabled = False
+_tls = threading.local()
+
+
+def _connect() -> sqlite3.Connection:
     ensure_data_dir()
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                message_id TEXT NOT NULL,
-                message_content TEXT NOT NULL,
-                published_at TEXT NOT NULL,
-                received_at TEXT NOT NULL,
-                is_duplicate INTEGER NOT NULL CHECK (is_duplicate IN (0, 1)),
-                transport_id TEXT,
-                source TEXT,
-                producer_name TEXT,
-                raw_payload TEXT NOT NULL
+    # Autocommit mode: write paths open their own transactions via _transaction().
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
+    for pragma in _CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def _conn() -> sqlite3.Connection:
+    conn = getattr(_tls, "conn", None)
+    if conn is None:
+        conn = _connect()
+        _tls.conn = conn
+        try:
+            init_db()
+        except BaseException:
+            # Never leave a connection cached for a database whose schema is missing.
+            del _tls.conn
+            conn.close()
+            raise
+    return conn
+
+
+@contextmanager
+def _transaction(conn: sqlite3.Connection) -> Iterator[sqlite3.Cursor]:
+    cursor = conn.cursor()
+    # Take the write lock up front so concurrent writers wait on the busy timeout.
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        yield cursor
+        cursor.execute("COMMIT")
+    except BaseException:
+        # A failed COMMIT leaves the transaction open; some errors already rolled back.
+        if conn.in_transaction:
+            cursor.execute("ROLLBACK")
+        raise
+
+
+# Bump when _create_schema changes so existing databases pick up the new objects.
+_SCHEMA_VERSION = 1
+
+
+def _create_fts_triggers(cursor: sqlite3.Cursor) -> None:
+    cursor.execute(
+        """
+        CREATE TRIGGER messages_fts_ai AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, message_id, message_content, source)
+            VALUES (new.id, new.message_id, new.message_content, new.source);
+        END
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TRIGGER messages_fts_ad AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, message_id, message_content, source)
+            VALUES ('delete', old.id, old.message_id, old.message_content, old.source);
+        END
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TRIGGER messages_fts_au AFTER UPDATE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, message_id, message_content, source)
+            VALUES ('delete', old.id, old.message_id, old.message_content, old.source);
+            INSERT INTO messages_fts (rowid, message_id, message_content, source)
+            VALUES (new.id, new.message_id, new.message_content, new.source);
+        END
+        """
+    )
+
+
+def _create_schema(cursor: sqlite3.Cursor) -> None:
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message_id TEXT NOT NULL,
+            message_content TEXT NOT NULL,
+            published_at TEXT NOT NULL,
+            received_at TEXT NOT NULL,
+            is_duplicate INTEGER NOT NULL CHECK (is_duplicate IN (0, 1)),
+            transport_id TEXT,
+            source TEXT,
+            producer_name TEXT,
+            raw_payload TEXT NOT NULL
+        )
+        """
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_messages_message_id ON messages(message_id)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_messages_received_at ON messages(received_at)"
+    )
+
+    # Serves the "Duplicates First" sort and the duplicate filters without a temp sort.
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_messages_dup_recv "
+        "ON messages(is_duplicate, received_at, id)"
+    )
+
+    # One row per distinct message_id; the primary key does the duplicate check.
+    seen_table_exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'seen_message_ids'"
+    ).fetchone()
+    if not seen_table_exists:
+        cursor.execute(
+            "CREATE TABLE seen_message_ids (message_id TEXT PRIMARY KEY) WITHOUT ROWID"
+        )
+        # Backfill from databases created before the table existed.
+        cursor.execute(
+            "INSERT OR IGNORE INTO seen_message_ids (message_id) SELECT message_id FROM messages"
+        )
+
+    # Trigram FTS5 needs SQLite 3.34+; without it, viewer search stays on LIKE.
+    fts_table_exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+    ).fetchone()
+    if not fts_table_exists:
+        cursor.execute("SAVEPOINT create_fts")
+        try:
+            cursor.execute(
+                """
+                CREATE VIRTUAL TABLE messages_fts USING fts5(
+                    message_id,
+                    message_content,
+                    source,
+                    content='messages',
+                    content_rowid='id',
+                    tokenize='trigram'
+                )
+                """
             )
-            """
+        except sqlite3.OperationalError:
+            # "no such module: fts5" or "no such tokenizer: trigram".
+            cursor.execute("ROLLBACK TO create_fts")
+            cursor.execute("RELEASE create_fts")
+        else:
+            cursor.execute("RELEASE create_fts")
+            _create_fts_triggers(cursor)
+            cursor.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+
+    # Local stand-in for the Pub/Sub topic: consumers page through it by id.
+    outbox_table_exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'outbox'"
+    ).fetchone()
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            envelope TEXT NOT NULL,
+            queued_at TEXT NOT NULL,
+            payload TEXT NOT NULL
         )
-        conn.execute(
-            "CREATE INDEX IF NOT EXISTS idx_messages_message_id ON messages(message_id)"
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS consumer_offsets (
+            name TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL
         )
-        conn.execute(
-            "CREATE INDEX IF NOT EXISTS idx_messages_received_at ON messages(received_at)"
+        """
+    )
+    if not outbox_table_exists:
+        _import_legacy_outbox(cursor)
+
+
+def _import_legacy_outbox(cursor: sqlite3.Cursor) -> None:
+    """Copy the old JSONL outbox and consumer_state.json offsets into the new tables."""
+    line_numbers: list[int] = []
+    if LEGACY_OUTBOX_PATH.exists():
+        rows = []
+        with LEGACY_OUTBOX_PATH.open("r", encoding="utf-8") as handle:
+            for line_number, line in enumerate(handle, start=1):
+                stripped = line.strip()
+                if not stripped:
+                    continue
+                line_numbers.append(line_number)
+                try:
+                    envelope = json.loads(stripped)
+                except json.JSONDecodeError:
+                    envelope = None
+                if not isinstance(envelope, dict):
+                    # Kept verbatim so the consumer stops on it, as it did before.
+                    rows.append((stripped, utc_now_iso(), stripped))
+                    continue
+                payload = envelope.pop("payload", None)
+                rows.append(
+                    (
+                        json.dumps(envelope, separators=(",", ":")),
+                        str(envelope.get("queued_at") or utc_now_iso()),
+                        json.dumps(payload, separators=(",", ":")),
+                    )
+                )
+        cursor.executemany(
+            "INSERT INTO outbox (envelope, queued_at, payload) VALUES (?, ?, ?)",
+            rows,
+        )
+
+    if LEGACY_CONSUMER_STATE_PATH.exists():
+        try:
+            with LEGACY_CONSUMER_STATE_PATH.open("r", encoding="utf-8") as handle:
+                state = json.load(handle)
+        except (json.JSONDecodeError, OSError):
+            state = {}
+        if not isinstance(state, dict):
+            state = {}
+        offsets = []
+        for name, value in state.items():
+            try:
+                # A line offset becomes the number of imported lines up to that line.
+                offsets.append((str(name), bisect.bisect_right(line_numbers, int(value))))
+            except (TypeError, ValueError):
+                continue
+        cursor.executemany(
+            "INSERT OR IGNORE INTO consumer_offsets (name, last_id) VALUES (?, ?)",
+            offsets,
         )
-        conn.commit()
 
 
-def create_payload(
-    content: str,
-    message_id: str | None = None,
-    producer_name: str = "local-producer",
-    user_name: str | None = None,
+def init_db() -> None:
+    global _db_initialized, _fts_enabled
+    if _db_initialized:
+        return
+
+    conn = _conn()
+    (version,) = conn.execute("PRAGMA user_version").fetchone()
+    if version < _SCHEMA_VERSION:
+        # WAL is persistent in the database file, so it only needs to be set once.
+        (journal_mode,) = conn.execute("PRAGMA journal_mode=WAL").fetchone()
+        if str(journal_mode).lower() != "wal":
+            raise sqlite3.OperationalError(
+                f"Could not switch {DB_PATH} to WAL journal mode (got {journal_mode!r})"
+            )
+        with _transaction(conn) as cursor:
+            # Re-check under the write lock in case another process just migrated.
+            (version,) = cursor.execute("PRAGMA user_version").fetchone()
+            if version < _SCHEMA_VERSION:
+                _create_schema(cursor)
+                cursor.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+    _fts_enabled = (
+        conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+        ).fetchone()
+        is not None
+    )
+    _db_initialized = True
+
+
+def _build_payload(
+    constant_fields: Dict[str, Any], content: str, message_id: str | None = None
 ) -> Dict[str, Any]:
     clean_content = (content or "").strip()
     if not clean_content:
         raise ValueError("Message content is required.")
 
+    clean_message_id = (message_id or str(uuid.uuid4())).strip()
+    if not clean_message_id:
+        raise ValueError("Message ID cannot be blank.")
+
     payload: Dict[str, Any] = {
-        "message_id": (message_id or str(uuid.uuid4())).strip(),
+        "message_id": clean_message_id,
         "content": clean_content,
         "published_at": utc_now_iso(),
-        "producer_name": producer_name,
     }
+    payload.update(constant_fields)
+    return payload
+
+
+def _constant_payload_fields(producer_name: str, user_name: str | None) -> Dict[str, Any]:
+    constant_fields: Dict[str, Any] = {"producer_name": producer_name}
     if user_name:
-        payload["user_name"] = user_name.strip()
+        constant_fields["user_name"] = user_name.strip()
+    return constant_fields
 
-    if not payload["message_id"]:
-        raise ValueError("Message ID cannot be blank.")
 
-    return payload
+def make_payload_factory(
+    producer_name: str = "local-producer",
+    user_name: str | None = None,
+) -> Callable[..., Dict[str, Any]]:
+    """Return ``build(content, message_id=None)`` with the producer/user fields fixed."""
+    constant_fields = _constant_payload_fields(producer_name, user_name)
 
+    def build(content: str, message_id: str | None = None) -> Dict[str, Any]:
+        return _build_payload(constant_fields, content, message_id)
 
-def append_outbox_message(payload: Dict[str, Any], source: str = "local-script") -> Dict[str, Any]:
-    ensure_data_dir()
-    envelope = {
+    return build
+
+
+def create_payload(
+    content: str,
+    message_id: str | None = None,
+    producer_name: str = "local-producer",
+    user_name: str | None = None,
+) -> Dict[str, Any]:
+    return _build_payload(_constant_payload_fields(producer_name, user_name), content, message_id)
+
+
+def _new_envelope(payload: Dict[str, Any], source: str, queued_at: str) -> Dict[str, Any]:
+    return {
         "transport_id": str(uuid.uuid4()),
-        "queued_at": utc_now_iso(),
+        "queued_at": queued_at,
         "source": source,
         "payload": payload,
     }
-    with OUTBOX_PATH.open("a", encoding="utf-8") as handle:
-        handle.write(json.dumps(envelope, sort_keys=True) + "\n")
-    return envelope
 
 
-def iter_outbox_from_line(start_line: int = 0) -> Iterator[Tuple[int, Dict[str, Any]]]:
-    if not OUTBOX_PATH.exists():
-        return
+def append_outbox_message(payload: Dict[str, Any], source: str = "local-script") -> Dict[str, Any]:
+    return append_outbox_messages([payload], source=source)[0]
 
-    with OUTBOX_PATH.open("r", encoding="utf-8") as handle:
-        for line_number, line in enumerate(handle, start=1):
-            if line_number <= start_line:
-                continue
-            stripped = line.strip()
-            if not stripped:
-                continue
-            try:
-                envelope = json.loads(stripped)
-            except json.JSONDecodeError as exc:
-                raise ValueError(f"Invalid JSON in outbox at line {line_number}: {exc}") from exc
-            yield line_number, envelope
 
+def append_outbox_messages(
+    payloads: Iterable[Dict[str, Any]], source: str = "local-script"
+) -> list[Dict[str, Any]]:
+    """Queue several payloads in one outbox transaction (one commit for the group)."""
+    queued_at = utc_now_iso()
+    envelopes = [_new_envelope(payload, source, queued_at) for payload in payloads]
+    if not envelopes:
+        return []
+
+    with _transaction(_conn()) as cursor:
+        cursor.executemany(
+            "INSERT INTO outbox (envelope, queued_at, payload) VALUES (?, ?, ?)",
+            (
+                # The payload JSON is stored as-is and reused as raw_payload.
+                (
+                    json.dumps(
+                        {key: value for key, value in envelope.items() if key != "payload"},
+                        separators=(",", ":"),
+                    ),
+                    queued_at,
+                    json.dumps(envelope["payload"], separators=(",", ":")),
+                )
+                for envelope in envelopes
+            ),
+        )
+    _mark_written()
+    return envelopes
 
-def _load_consumer_state_map() -> Dict[str, int]:
-    ensure_data_dir()
-    if not CONSUMER_STATE_PATH.exists():
-        return {}
 
-    try:
-        with CONSUMER_STATE_PATH.open("r", encoding="utf-8") as handle:
-            data = json.load(handle)
-    except (json.JSONDecodeError, OSError):
-        return {}
+def submit_message(
+    payload: Dict[str, Any],
+    source: str = "local-script",
+    *,
+    direct: bool = False,
+    consumer_name: str = "direct-insert",
+) -> Tuple[Dict[str, Any], Dict[str, Any] | None]:
+    """Queue ``payload``, or with ``direct=True`` insert it into messages right away."""
+    if not direct:
+        return append_outbox_message(payload, source=source), None
+
+    envelope = _new_envelope(payload, source, utc_now_iso())
+    result = insert_message_from_payload(
+        payload,
+        transport_id=envelope["transport_id"],
+        source=source,
+        consumer_name=consumer_name,
+    )
+    return envelope, result
 
-    if not isinstance(data, dict):
-        return {}
 
-    result: Dict[str, int] = {}
-    for key, value in data.items():
-        try:
-            result[str(key)] = int(value)
-        except (TypeError, ValueError):
-            continue
-    return result
+# Rows fetched per outbox query, so no read cursor stays open while the caller writes.
+_OUTBOX_PAGE_SIZE = 500
 
 
-def get_consumer_offset(consumer_name: str) -> int:
-    return _load_consumer_state_map().get(consumer_name, 0)
+def iter_outbox_from_id(last_id: int = 0) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Yield ``(outbox_id, envelope)`` after ``last_id``; ``payload_raw`` is the payload JSON."""
+    conn = _conn()
+    while True:
+        rows = conn.execute(
+            "SELECT id, envelope, payload FROM outbox WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, _OUTBOX_PAGE_SIZE),
+        ).fetchall()
+        for outbox_id, raw_envelope, raw_payload in rows:
+            try:
+                envelope = _json_loads(raw_envelope)
+                payload = _json_loads(raw_payload)
+            except json.JSONDecodeError as exc:  # orjson's error subclasses this too
+                raise ValueError(f"Invalid JSON in outbox at id {outbox_id}: {exc}") from exc
+            if not isinstance(envelope, dict):
+                raise ValueError(f"Invalid envelope in outbox at id {outbox_id}: not a JSON object")
+            envelope["payload"] = payload
+            envelope["payload_raw"] = raw_payload
+            yield outbox_id, envelope
+        if len(rows) < _OUTBOX_PAGE_SIZE:
+            return
+        last_id = rows[-1][0]
+
+
+_UPSERT_OFFSET_SQL = """
+    INSERT INTO consumer_offsets (name, last_id) VALUES (?, ?)
+    ON CONFLICT(name) DO UPDATE SET last_id = excluded.last_id
+"""
 
 
-def set_consumer_offset(consumer_name: str, last_line: int) -> None:
-    state = _load_consumer_state_map()
-    state[consumer_name] = max(0, int(last_line))
-    ensure_data_dir()
-    with CONSUMER_STATE_PATH.open("w", encoding="utf-8") as handle:
-        json.dump(state, handle, indent=2, sort_keys=True)
+def get_consumer_offset(consumer_name: str) -> int:
+    row = _conn().execute(
+        "SELECT last_id FROM consumer_offsets WHERE name = ?",
+        (consumer_name,),
+    ).fetchone()
+    return int(row[0]) if row else 0
 
 
-def insert_message_from_payload(
-    payload: Dict[str, Any],
-    *,
-    transport_id: str | None = None,
-    source: str | None = None,
-    consumer_name: str = "consumer-stub",
-) -> Dict[str, Any]:
-    init_db()
+def set_consumer_offset(consumer_name: str, last_id: int) -> None:
+    with _transaction(_conn()) as cursor:
+        cursor.execute(_UPSERT_OFFSET_SQL, (consumer_name, max(0, int(last_id))))
+
 
+def _required_payload_fields(payload: Dict[str, Any]) -> Tuple[str, str]:
     message_id = str(payload.get("message_id", "")).strip()
     content = str(payload.get("content", "")).strip()
-    published_at = str(payload.get("published_at", "")).strip() or utc_now_iso()
-    producer_name = str(payload.get("producer_name", "")).strip() or "unknown-producer"
-    if consumer_name:
-        producer_name = producer_name
 
     if not message_id:
         raise ValueError("Payload missing required field: message_id")
     if not content:
         raise ValueError("Payload missing required field: content")
+    return message_id, content
 
-    received_at = utc_now_iso()
-    raw_payload = json.dumps(payload, sort_keys=True)
 
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
+def validate_outbox_envelope(envelope: Dict[str, Any]) -> None:
+    """Raise ValueError if ``envelope`` cannot be saved by insert_messages_batch."""
+    _required_payload_fields(envelope.get("payload") or {})
 
-        # Duplicate detection happens before insert to mirror the project requirement.
-        duplicate_exists = (
-            cursor.execute(
-                "SELECT 1 FROM messages WHERE message_id = ? LIMIT 1",
-                (message_id,),
-            ).fetchone()
-            is not None
-        )
-        is_duplicate = 1 if duplicate_exists else 0
 
-        cursor.execute(
-            """
-            INSERT INTO messages (
-                message_id,
-                message_content,
-                published_at,
-                received_at,
-                is_duplicate,
-                transport_id,
-                source,
-                producer_name,
-                raw_payload
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                message_id,
-                content,
-                published_at,
-                received_at,
-                is_duplicate,
-                transport_id,
-                source,
-                producer_name,
-                raw_payload,
-            ),
-        )
-        row_id = cursor.lastrowid
-        conn.commit()
+def _prepare_message_row(
+    payload: Dict[str, Any],
+    transport_id: str | None,
+    source: str | None,
+    raw_payload: str | None = None,
+    received_at: str | None = None,
+) -> Dict[str, Any]:
+    message_id, content = _required_payload_fields(payload)
+    received_at = received_at or utc_now_iso()
+    published_at = str(payload.get("published_at", "")).strip() or received_at
+    producer_name = str(payload.get("producer_name", "")).strip() or "unknown-producer"
 
     return {
-        "id": row_id,
         "message_id": message_id,
         "message_content": content,
         "published_at": published_at,
         "received_at": received_at,
-        "is_duplicate": bool(is_duplicate),
         "transport_id": transport_id,
         "source": source,
-        "consumer_name": consumer_name,
+        "producer_name": producer_name,
+        "raw_payload": raw_payload or json.dumps(payload, separators=(",", ":")),
     }
 
 
+_INSERT_MESSAGE_SQL = """
+    INSERT INTO messages (
+        message_id,
+        message_content,
+        published_at,
+        received_at,
+        is_duplicate,
+        transport_id,
+        source,
+        producer_name,
+        raw_payload
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Stay well below SQLITE_MAX_VARIABLE_NUMBER for the IN (...) probe.
+_ID_PROBE_CHUNK = 500
+
+
+def _insert_message_rows(
+    cursor: sqlite3.Cursor, rows: list[Dict[str, Any]]
+) -> list[Dict[str, Any]]:
+    # Duplicate detection happens before insert to mirror the project requirement.
+    unique_ids = list(dict.fromkeys(row["message_id"] for row in rows))
+    seen: set[str] = set()
+    for offset in range(0, len(unique_ids), _ID_PROBE_CHUNK):
+        chunk = unique_ids[offset : offset + _ID_PROBE_CHUNK]
+        placeholders = ",".join("?" * len(chunk))
+        seen.update(
+            message_id
+            for (message_id,) in cursor.execute(
+                f"SELECT message_id FROM seen_message_ids WHERE message_id IN ({placeholders})",
+                chunk,
+            )
+        )
+
+    new_ids = [message_id for message_id in unique_ids if message_id not in seen]
+    flags: list[int] = []
+    for row in rows:
+        message_id = row["message_id"]
+        flags.append(1 if message_id in seen else 0)
+        seen.add(message_id)
+
+    cursor.executemany(
+        "INSERT INTO seen_message_ids (message_id) VALUES (?)",
+        ((message_id,) for message_id in new_ids),
+    )
+    cursor.executemany(
+        _INSERT_MESSAGE_SQL,
+        (
+            (
+                row["message_id"],
+                row["message_content"],
+                row["published_at"],
+                row["received_at"],
+                is_duplicate,
+                row["transport_id"],
+                row["source"],
+                row["producer_name"],
+                row["raw_payload"],
+            )
+            for row, is_duplicate in zip(rows, flags)
+        ),
+    )
+
+    # The write lock is held for the whole transaction, so the new ids are contiguous.
+    (last_id,) = cursor.execute("SELECT last_insert_rowid()").fetchone()
+    first_id = last_id - len(rows) + 1
+
+    return [
+        {
+            "id": first_id + index,
+            "message_id": row["message_id"],
+            "message_content": row["message_content"],
+            "published_at": row["published_at"],
+            "received_at": row["received_at"],
+            "is_duplicate": bool(is_duplicate),
+            "transport_id": row["transport_id"],
+            "source": row["source"],
+        }
+        for index, (row, is_duplicate) in enumerate(zip(rows, flags))
+    ]
+
+
+def insert_message_from_payload(
+    payload: Dict[str, Any],
+    *,
+    transport_id: str | None = None,
+    source: str | None = None,
+    consumer_name: str = "consumer-stub",
+    raw_payload: str | None = None,
+) -> Dict[str, Any]:
+    row = _prepare_message_row(payload, transport_id, source, raw_payload)
+
+    with _transaction(_conn()) as cursor:
+        (result,) = _insert_message_rows(cursor, [row])
+    _mark_written()
+
+    result["consumer_name"] = consumer_name
+    return result
+
+
+def insert_messages_batch(
+    envelopes: Iterable[Dict[str, Any]],
+    *,
+    consumer_name: str = "consumer-stub",
+    offset: int | None = None,
+) -> list[Dict[str, Any]]:
+    """Insert envelopes in one transaction, saving ``offset`` for ``consumer_name`` with them."""
+    # One timestamp per batch: received_at means "arrived in this consumer run".
+    received_at = utc_now_iso()
+    rows = [
+        _prepare_message_row(
+            envelope.get("payload") or {},
+            envelope.get("transport_id"),
+            envelope.get("source"),
+            envelope.get("payload_raw"),
+            received_at,
+        )
+        for envelope in envelopes
+    ]
+    if not rows:
+        return []
+
+    with _transaction(_conn()) as cursor:
+        results = _insert_message_rows(cursor, rows)
+        if offset is not None:
+            cursor.execute(_UPSERT_OFFSET_SQL, (consumer_name, max(0, int(offset))))
+    _mark_written()
+
+    for result in results:
+        result["consumer_name"] = consumer_name
+    return results
+
+
+_DUPLICATE_FILTERS = {
+    "all": None,
+    "only": "is_duplicate = 1",
+    "exclude": "is_duplicate = 0",
+}
+
+# The trigram tokenizer cannot match terms shorter than this, so those fall back to LIKE.
+_FTS_MIN_TERM_LENGTH = 3
+_SEARCH_CONDITIONS = {
+    "none": None,
+    "fts": "id IN (SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?)",
+    "like": "(message_id LIKE ? OR message_content LIKE ? OR COALESCE(source, '') LIKE ?)",
+}
+
+
+# is_duplicate must stay at index 5; fetch_messages converts it to bool by position.
+_FETCH_COLUMNS = (
+    "id",
+    "message_id",
+    "message_content",
+    "published_at",
+    "received_at",
+    "is_duplicate",
+    "transport_id",
+    "source",
+    "producer_name",
+)
+
+
+def _build_fetch_sql(
+    sort_sql: str, duplicate_condition: str | None, search_condition: str | None
+) -> str:
+    if duplicate_condition and search_condition == _SEARCH_CONDITIONS["fts"]:
+        # Unary + keeps is_duplicate off idx_messages_dup_recv so the FTS rowids drive the query.
+        duplicate_condition = "+" + duplicate_condition
+    sql = f"SELECT {', '.join(_FETCH_COLUMNS)} FROM messages"
+    conditions = [c for c in (duplicate_condition, search_condition) if c]
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    return sql + f" ORDER BY {sort_sql}"
+
+
+# Every viewer query shape is known up front, so build the SQL once at import time.
+_FETCH_SQL = {
+    (sort_key, duplicate_filter, search_mode): _build_fetch_sql(
+        sort_sql, duplicate_condition, search_condition
+    )
+    for sort_key, (_, sort_sql) in SORT_OPTIONS.items()
+    for duplicate_filter, duplicate_condition in _DUPLICATE_FILTERS.items()
+    for search_mode, search_condition in _SEARCH_CONDITIONS.items()
+}
+
+
 def fetch_messages(
     *,
     sort_key: str = "received_desc",
     duplicate_filter: str = "all",
     search: str = "",
 ) -> list[Dict[str, Any]]:
-    init_db()
-    sort_sql = SORT_OPTIONS.get(sort_key, SORT_OPTIONS["received_desc"])[1]
+    if sort_key not in SORT_OPTIONS:
+        sort_key = "received_desc"
+    if duplicate_filter not in _DUPLICATE_FILTERS:
+        duplicate_filter = "all"
 
-    conditions: list[str] = []
+    conn = _conn()
     params: list[Any] = []
-
-    if duplicate_filter == "only":
-        conditions.append("is_duplicate = 1")
-    elif duplicate_filter == "exclude":
-        conditions.append("is_duplicate = 0")
-
     search_term = (search or "").strip()
-    if search_term:
+    if not search_term:
+        search_mode = "none"
+    elif _fts_enabled and len(search_term) >= _FTS_MIN_TERM_LENGTH:
+        search_mode = "fts"
+        # Quote the term as a single FTS5 phrase so user input is never parsed as query syntax.
+        params.append('"' + search_term.replace('"', '""') + '"')
+    else:
+        search_mode = "like"
         like_value = f"%{search_term}%"
-        conditions.append("(message_id LIKE ? OR message_content LIKE ? OR COALESCE(source, '') LIKE ?)")
         params.extend([like_value, like_value, like_value])
 
-    sql = (
-        "SELECT id, message_id, message_content, published_at, received_at, is_duplicate, "
-        "transport_id, source, producer_name FROM messages"
-    )
-    if conditions:
-        sql += " WHERE " + " AND ".join(conditions)
-    sql += f" ORDER BY {sort_sql}"
+    sql = _FETCH_SQL[(sort_key, duplicate_filter, search_mode)]
 
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
-        rows = conn.execute(sql, params).fetchall()
+    rows = conn.execute(sql, params).fetchall()
+    return [dict(zip(_FETCH_COLUMNS, row[:5] + (bool(row[5]),) + row[6:])) for row in rows]
 
-    messages: list[Dict[str, Any]] = []
-    for row in rows:
-        item = dict(row)
-        item["is_duplicate"] = bool(item["is_duplicate"])
-        messages.append(item)
-    return messages
 
+# Page renders reuse a recent summary unless this process has written since.
+_SUMMARY_TTL_SECONDS = 0.5
+_summary_cache: Dict[str, Any] = {"ts": 0.0, "generation": -1, "val": None}
+_writes_generation = 0
 
-def get_summary() -> Dict[str, Any]:
-    init_db()
-    with sqlite3.connect(DB_PATH) as conn:
-        total, duplicates = conn.execute(
-            "SELECT COUNT(*), COALESCE(SUM(is_duplicate), 0) FROM messages"
-        ).fetchone()
 
-    return {
+def _mark_written() -> None:
+    global _writes_generation
+    _writes_generation += 1
+
+
+def get_summary() -> Dict[str, Any]:
+    now = time.monotonic()
+    cached = _summary_cache["val"]
+    if (
+        cached is not None
+        and _summary_cache["generation"] == _writes_generation
+        and now - _summary_cache["ts"] < _SUMMARY_TTL_SECONDS
+    ):
+        return dict(cached)
+
+    generation = _writes_generation
+    # Outbox ids are dense, so MAX(id) is the all-time count without a COUNT(*) scan.
+    total, duplicates, outbox_count = _conn().execute(
+        """
+        SELECT
+            (SELECT COUNT(*) FROM messages),
+            (SELECT COALESCE(SUM(is_duplicate), 0) FROM messages),
+            (SELECT COALESCE(MAX(id), 0) FROM outbox)
+        """
+    ).fetchone()
+
+    summary = {
         "db_path": str(DB_PATH),
-        "outbox_path": str(OUTBOX_PATH),
-        "outbox_count": count_outbox_lines(),
+        "outbox_count": int(outbox_count or 0),
         "db_total": int(total or 0),
         "db_duplicates": int(duplicates or 0),
     }
-
-
-def count_outbox_lines() -> int:
-    if not OUTBOX_PATH.exists():
-        return 0
-    with OUTBOX_PATH.open("r", encoding="utf-8") as handle:
-        return sum(1 for line in handle if line.strip())
+    _summary_cache.update(ts=now, generation=generation, val=summary)
+    return dict(summary)